@@ -1,17 +1,31 @@
 import cv2
 import torch
 from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionPredictor
 import threading
+import queue
 import time
 from datetime import datetime
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import Future
+from types import SimpleNamespace
 import os
+import shutil
+import tempfile
 import logging
 import pytz
 import numpy as np
+import yaml
 from sqlalchemy import Column, Integer, String, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 
+# PyTurboJPEG is optional; without it (or libturbojpeg) frames are encoded with OpenCV
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+
 # --- Basic Configuration ---
 IST = pytz.timezone('Asia/Kolkata')
 Base = declarative_base()
@@ -25,14 +39,263 @@ GENERAL_MODEL_PATH = os.path.join(MODELS_FOLDER, 'yolov8n.pt')
 # --- Detection Configuration ---
 CONFIDENCE_THRESHOLD = 0.50
 FRAME_SKIP_RATE = 5
+MICRO_BATCH_SIZE = 4  # Sampled frames per channel submitted together for apron/cap + gloves
+INFERENCE_BATCH_SIZE = 8  # Frames per shared inference call of one model, across channels
+INFERENCE_BATCH_TIMEOUT = 0.01  # Seconds to wait for more frames before running a partial batch
+INFERENCE_RETRY_DELAY = 1  # Seconds a channel backs off after a failed inference before the next frame
+# ByteTrack: fixed kitchen cameras gain nothing from BoT-SORT's camera-motion compensation,
+# which also needs the host BGR frame in every tracker update
+TRACKER_CONFIG = 'bytetrack.yaml'
+TRACKER_FRAME_RATE = 30  # Same frame rate Ultralytics' own model.track() gives its trackers
+PERSON_CLASS_ID = 0
+PHONE_CLASS_ID = 67
 PHONE_PERSISTENCE_SECONDS = 3
+PHONE_MATCH_DISTANCE = 50  # Max center shift (pixels) for a phone to keep its ID between frames
 ALERT_COOLDOWN_SECONDS = 60
 
+# --- Stream Capture Configuration ---
+FFMPEG_CAPTURE_OPTIONS = 'rtsp_transport;tcp|timeout;5000000'
+NVDEC_VIDEO_CODEC = 'h264_cuvid'  # FFmpeg NVDEC decoder used when CUDA is available
+CAPTURE_TIMEOUT_MSEC = 5000
+# Applied per capture at open time, so the open itself is bounded too
+CAPTURE_PARAMS = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, CAPTURE_TIMEOUT_MSEC, cv2.CAP_PROP_READ_TIMEOUT_MSEC, CAPTURE_TIMEOUT_MSEC]
+# OPENCV_FFMPEG_CAPTURE_OPTIONS is process-wide and read when a capture opens (OpenCV has no
+# per-capture NVDEC option), so channels set it and open their capture under this lock
+_capture_options_lock = threading.Lock()
+
+# --- Stream Output Configuration ---
+JPEG_QUALITY = 80  # Same quality for TurboJPEG and the OpenCV fallback
+
+# --- TensorRT Configuration ---
+TRT_IMAGE_SIZE = 640
+MODEL_STRIDE = 32  # PyTorch models take any input whose sides are multiples of this
+TRT_WORKSPACE_GB = 4
+# INT8 engines are opt-in: once enough kitchen frames are recorded under CALIB_FOLDER they are
+# used for calibration; every model falls back to its FP16 engine if the INT8 build fails
+TRT_INT8 = os.environ.get('KITCHEN_TRT_INT8', 'false').lower() == 'true'
+CALIB_FOLDER = os.path.join(MODELS_FOLDER, 'calib')
+CALIB_IMAGES_FOLDER = os.path.join(CALIB_FOLDER, 'images')
+CALIB_TARGET_FRAMES = 500
+CALIB_RECORD_INTERVAL = 10  # Seconds between recorded calibration frames per channel
+
 # --- Uniform Color Ranges (HSV) ---
 YELLOW_LOWER = np.array([18, 80, 80])
 YELLOW_UPPER = np.array([35, 255, 255])
 BLACK_LOWER = np.array([0, 0, 0])
 BLACK_UPPER = np.array([180, 255, 50])
+UNIFORM_COMPLIANT_MIN_RATIO = 0.30  # Below this share of compliant torso pixels is a violation
+# A 32x32 thumbnail ratio outside this band is trusted without running the full CLAHE mask
+UNIFORM_PREFILTER_LOW = 0.10
+UNIFORM_PREFILTER_HIGH = 0.50
+UNIFORM_PREFILTER_SIZE = (32, 32)
+
+# OpenCV T-API: run the whole-frame color pipeline through OpenCL (e.g. an iGPU) when a device exists
+USE_OPENCL = cv2.ocl.haveOpenCL()
+
+def _encode_jpeg(image):
+    """Encode a BGR frame to JPEG bytes, via libjpeg-turbo when available."""
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(image, quality=JPEG_QUALITY, pixel_format=TJPF_BGR)
+    success, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return jpeg.tobytes() if success else b''
+
+# --- Model Loading ---
+class _TensorInputPredictor(DetectionPredictor):
+    """DetectionPredictor that does not copy tensor inputs back to the host as "original" images.
+
+    For a tensor source Ultralytics downloads the whole input batch as uint8 just to
+    give each Results an orig_img. The shared inputs are already letterboxed, so a
+    zero-stride placeholder of the input's shape keeps box scaling an identity.
+    """
+    def postprocess(self, preds, img, orig_imgs, *args, **kwargs):
+        if isinstance(orig_imgs, torch.Tensor):
+            placeholder = np.broadcast_to(np.zeros((), dtype=np.uint8), (*img.shape[2:], 3))
+            orig_imgs = [placeholder] * len(img)
+        return super().postprocess(preds, img, orig_imgs, *args, **kwargs)
+
+def _calibration_image_count():
+    """Number of kitchen frames recorded so far for INT8 calibration"""
+    if not os.path.isdir(CALIB_IMAGES_FOLDER):
+        return 0
+    return sum(1 for name in os.listdir(CALIB_IMAGES_FOLDER) if name.endswith('.jpg'))
+
+def _calibration_data_yaml(model_path, names):
+    """Write an images-only dataset YAML over the recorded frames, with this model's class names"""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    data_path = os.path.join(CALIB_FOLDER, f"{stem}_calib.yaml")
+    with open(data_path, 'w') as f:
+        yaml.safe_dump({
+            'path': os.path.abspath(CALIB_FOLDER), 'train': 'images', 'val': 'images', 'names': names,
+        }, f)
+    return data_path
+
+def _load_engine(engine_path):
+    """Open a TensorRT engine and run one warm-up inference.
+
+    Ultralytics only deserializes an engine on its first prediction, so a stale
+    cached engine (TensorRT/driver upgrade, different GPU) fails here rather
+    than in the inference loop.
+    """
+    # TensorRT handles precision internally, no .to()/.half() needed
+    model = YOLO(engine_path, task='detect')
+    # The first call creates the model's predictor, so it already has to be the tensor-input one
+    model(np.zeros((TRT_IMAGE_SIZE, TRT_IMAGE_SIZE, 3), dtype=np.uint8), verbose=False, device=0,
+          predictor=_TensorInputPredictor)
+    return model
+
+def _export_engine(model_path, engine_path, batch, int8=False):
+    """Load the TensorRT engine cached at engine_path, exporting it when missing or no longer loadable"""
+    if os.path.exists(engine_path):
+        try:
+            return _load_engine(engine_path)
+        except Exception as e:
+            logging.warning(f"Cached TensorRT engine {engine_path} failed to load, re-exporting: {e}")
+            os.remove(engine_path)
+
+    logging.info(f"Exporting {model_path} to TensorRT engine {engine_path} (one-time)...")
+    # Ultralytics writes the engine and its intermediates next to the weights, i.e. over
+    # {stem}.engine, so export from a copy in a scratch directory and move only the engine out
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(engine_path)) as export_dir:
+        model = YOLO(shutil.copy(model_path, export_dir))
+        if int8:
+            precision_args = {'int8': True, 'data': _calibration_data_yaml(model_path, model.names)}
+        else:
+            precision_args = {'half': True}
+        exported_path = model.export(
+            format='engine', imgsz=TRT_IMAGE_SIZE, batch=batch, dynamic=batch > 1,
+            device=0, workspace=TRT_WORKSPACE_GB, **precision_args
+        )
+        os.replace(exported_path, engine_path)
+    return _load_engine(engine_path)
+
+def _load_yolo_model(model_path, device, batch=1):
+    """Load a YOLO model, preferring a cached TensorRT engine (INT8 if enabled, else FP16) on CUDA"""
+    if device == 'cuda':
+        # Batched engines are exported with a dynamic batch axis up to `batch` and cached separately
+        stem = os.path.splitext(model_path)[0]
+        engine_stem = stem if batch == 1 else f"{stem}_b{batch}"
+        if TRT_INT8:
+            int8_engine_path = f"{engine_stem}_int8.engine"
+            if os.path.exists(int8_engine_path) or _calibration_image_count() >= CALIB_TARGET_FRAMES:
+                try:
+                    return _export_engine(model_path, int8_engine_path, batch, int8=True)
+                except Exception as e:
+                    logging.warning(f"INT8 engine unavailable for {model_path}, falling back to FP16: {e}")
+            else:
+                logging.info(f"INT8 calibration pending for {model_path}: using FP16 until "
+                             f"{CALIB_TARGET_FRAMES} frames are recorded in {CALIB_IMAGES_FOLDER}")
+        try:
+            return _export_engine(model_path, f"{engine_stem}.engine", batch)
+        except Exception as e:
+            logging.warning(f"TensorRT engine unavailable for {model_path}, falling back to PyTorch: {e}")
+
+    model = YOLO(model_path)
+    model.to(device)
+    if device == 'cuda':
+        model.half()
+    return model
+
+def _host_detections(result, scale):
+    """(xyxy, conf, cls) host arrays of one Results object, with boxes mapped back to frame coordinates"""
+    data = result.boxes.data.cpu().numpy()
+    return data[:, :4] / scale, data[:, -2], data[:, -1].astype(np.int32)
+
+# --- Shared Inference Servers ---
+class InferenceServer:
+    """Runs one stateless YOLO model on a worker thread, batching inputs submitted by all channels.
+
+    Extra keyword arguments (e.g. classes) are passed to every prediction.
+    """
+    def __init__(self, model_path, device, batch=INFERENCE_BATCH_SIZE, timeout=INFERENCE_BATCH_TIMEOUT, **predict_args):
+        self.model = _load_yolo_model(model_path, device, batch=batch)
+        self.names = self.model.names
+        # Exported TensorRT engines only accept the square export size; .pt models take any stride multiple
+        self.static_shape = not isinstance(self.model.model, torch.nn.Module)
+        self.device = device
+        self.batch = batch
+        self.timeout = timeout
+        self.predict_args = predict_args
+        self.requests = queue.Queue()
+        # Each server has its own stream so different models' kernels can overlap (no-op on CPU)
+        self.stream = torch.cuda.Stream() if device == 'cuda' else None
+        self.worker = threading.Thread(target=self._run, name=f"Inference-{os.path.basename(model_path)}", daemon=True)
+        self.worker.start()
+
+    def submit(self, input_tensor):
+        """Queue a (1, 3, H, W) input for inference; the returned future resolves to its Results"""
+        future = Future()
+        # The input may still be in flight on the caller's stream; the worker waits on this event
+        ready = torch.cuda.Event() if self.stream is not None else None
+        if ready is not None:
+            ready.record()
+        self.requests.put((input_tensor, ready, future))
+        return future
+
+    def _run(self):
+        while True:
+            pending = [self.requests.get()]
+            deadline = time.time() + self.timeout
+            while len(pending) < self.batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Only equally shaped inputs can be concatenated; channels whose letterboxed
+            # size differs run as separate batches
+            batches = {}
+            for request in pending:
+                batches.setdefault(tuple(request[0].shape), []).append(request)
+            for batch in batches.values():
+                self._infer(batch)
+
+    def _infer(self, batch):
+        try:
+            with torch.inference_mode(), torch.cuda.stream(self.stream):
+                for _, ready, _ in batch:
+                    if ready is not None:
+                        self.stream.wait_event(ready)
+                results = self.model(
+                    torch.cat([input_tensor for input_tensor, _, _ in batch]), conf=CONFIDENCE_THRESHOLD,
+                    verbose=False, device=self.device, predictor=_TensorInputPredictor, **self.predict_args
+                )
+            if self.stream is not None:
+                # Callers read the results on their own streams
+                self.stream.synchronize()
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            logging.error(f"Shared inference failed: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+
+def _create_tracker():
+    """ByteTrack instance for one channel's detections, across Ultralytics versions"""
+    # Imported here: the tracker module needs (or tries to pip install) `lap`, which must not
+    # be a requirement for importing this module from main_app
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils.checks import check_yaml
+
+    with open(check_yaml(TRACKER_CONFIG)) as f:
+        tracker_args = SimpleNamespace(**yaml.safe_load(f))
+    try:
+        return BYTETracker(tracker_args, frame_rate=TRACKER_FRAME_RATE)
+    except TypeError:
+        # Newer releases take only the config and derive the lost-track buffer from it directly
+        return BYTETracker(tracker_args)
+
+_inference_servers = {}
+_inference_servers_lock = threading.Lock()
+
+def get_inference_server(model_path, device, **predict_args):
+    """Return the process-wide InferenceServer for a model, loading it on first use"""
+    with _inference_servers_lock:
+        if model_path not in _inference_servers:
+            _inference_servers[model_path] = InferenceServer(model_path, device, **predict_args)
+        return _inference_servers[model_path]
 
 # --- Database Table Definition ---
 class KitchenViolation(Base):
@@ -54,8 +317,20 @@ class KitchenComplianceProcessor(threading.Thread):
         self.channel_name = channel_name
         self.is_running = True
         self.error_message = None
-        self.latest_frame = None
         self.lock = threading.Lock()
+        # Published frames: two buffers written alternately, and a generation counter bumped after
+        # each write; (generation - 1) & 1 is the newest complete buffer
+        self._frame_buffers = None
+        self._frame_generation = 0
+        # Size-1 slot the decoder thread fills with the newest frame
+        self._slot = None
+        self._slot_lock = threading.Lock()
+        # Cleared once NVDEC fails on a source that opens in software, so reconnects skip it
+        self._try_nvdec = True
+
+        # Placeholder images are static, so their JPEG bytes are encoded only once
+        self._placeholder_jpeg = self._encode_placeholder('Connecting...', (180, 240), 1, (201, 209, 217))
+        self._error_jpegs = {}
 
         self.SessionLocal = SessionLocal
         self.socketio = socketio
@@ -81,31 +356,50 @@ class KitchenComplianceProcessor(threading.Thread):
                 if not os.path.exists(model_path):
                     raise FileNotFoundError(f"Missing model file: {model_path}")
             
-            self.apron_cap_model = YOLO(APRON_CAP_MODEL_PATH)
-            self.gloves_model = YOLO(GLOVES_MODEL_PATH)
-            self.general_model = YOLO(GENERAL_MODEL_PATH)
-            
-            # Move to device and optimize
-            self.apron_cap_model.to(self.device)
-            self.gloves_model.to(self.device)
-            self.general_model.to(self.device)
-            
-            # Enable half precision for CUDA
-            if self.device == 'cuda':
-                self.apron_cap_model.half()
-                self.gloves_model.half()
-                self.general_model.half()
+            # One copy of each model serves every channel; tracking state stays per channel
+            # in self.tracker, fed with the shared general model's detections
+            self.apron_cap_model = get_inference_server(APRON_CAP_MODEL_PATH, self.device)
+            self.gloves_model = get_inference_server(GLOVES_MODEL_PATH, self.device)
+            self.general_model = get_inference_server(
+                GENERAL_MODEL_PATH, self.device, classes=[PERSON_CLASS_ID, PHONE_CLASS_ID]
+            )
+            self.tracker = _create_tracker()
+            # The one shared input tensor must suit every model it is fed to
+            self._square_input = any(
+                server.static_shape for server in (self.apron_cap_model, self.gloves_model, self.general_model)
+            )
+
+            # Integer class ids of interest, so the hot loop compares ints instead of names
+            apron_cap_ids = {v: k for k, v in self.apron_cap_model.names.items()}
+            self._without_apron_id = apron_cap_ids.get('Without-apron')
+            self._without_cap_id = apron_cap_ids.get('Without-cap')
+            self._glove_class_ids = np.array(
+                [k for k, v in self.gloves_model.names.items() if v == 'surgical-gloves'], dtype=np.int32
+            )
             
             logging.info(f"Successfully loaded Kitchen Compliance models for {self.channel_name} on {self.device}")
         except Exception as e:
             self.error_message = f"Model Error: {e}"
             logging.error(f"FATAL: Failed to initialize Kitchen models for {self.channel_name}. Error: {e}")
 
-        self.person_violation_tracker = defaultdict(lambda: defaultdict(float))
-        self.phone_tracker = {}
-        self.last_apron_cap_results = []
-        self.last_gloves_results = []
+        # Last alert time per (track_id, violation_class)
+        self.person_violation_tracker = {}
+        # Phone tracks as parallel arrays (one row per tracked phone)
+        self.phone_ids = np.empty(0, dtype=np.int64)
+        self.phone_centers = np.empty((0, 2), dtype=np.float32)
+        self.phone_first_seen = np.empty(0, dtype=np.float64)
+        self.phone_alerted = np.empty(0, dtype=bool)
+        self.next_phone_id = 1
+        # Per batched frame: (xyxy, conf, cls) arrays in frame coordinates
+        self.last_apron_cap_detections = []
+        self.last_gloves_detections = []
+        self.last_gloves_boxes = np.empty((0, 4), dtype=np.float32)
+        self.frame_batch = deque(maxlen=MICRO_BATCH_SIZE)
+        self._input_buffer = None
+        self._input_shape = None
+        self._input_upload_done = None
         self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self._next_calib_record_time = 0.0
 
     @staticmethod
     def initialize_tables(engine):
@@ -122,22 +416,49 @@ class KitchenComplianceProcessor(threading.Thread):
         logging.info(f"Shutting down Kitchen Compliance processor for {self.channel_name}.")
         self.is_running = False
 
+    @staticmethod
+    def _encode_placeholder(text, org, font_scale, color):
+        placeholder = np.full((480, 640, 3), (22, 27, 34), dtype=np.uint8)
+        cv2.putText(placeholder, text, org, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+        return _encode_jpeg(placeholder)
+
+    def _publish_frame(self, frame):
+        """Copy a frame into the back buffer, then bump the generation to make it the newest"""
+        buffers = self._frame_buffers
+        if buffers is None or buffers[0].shape != frame.shape:
+            # Both buffers start as valid frames, so a reader never sees an unwritten one
+            self._frame_buffers = [frame.copy(), frame.copy()]
+        else:
+            np.copyto(buffers[self._frame_generation & 1], frame)
+        self._frame_generation += 1
+
+    def _snapshot_frame(self):
+        """Copy of the newest published frame without taking a lock, or None before the first one"""
+        while True:
+            generation = self._frame_generation
+            if generation == 0:
+                return None
+            snapshot = self._frame_buffers[(generation - 1) & 1].copy()
+            # Any publish since the read means the writer may have moved on to the buffer just copied
+            if self._frame_generation == generation:
+                return snapshot
+
     def get_frame(self):
-        with self.lock:
-            if self.error_message:
-                placeholder = np.full((480, 640, 3), (22, 27, 34), dtype=np.uint8)
-                cv2.putText(placeholder, f'Error: {self.error_message}', (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                _, jpeg = cv2.imencode('.jpg', placeholder)
-                return jpeg.tobytes()
-            
-            if self.latest_frame is not None:
-                success, jpeg = cv2.imencode('.jpg', self.latest_frame)
-                return jpeg.tobytes() if success else b''
-            else:
-                placeholder = np.full((480, 640, 3), (22, 27, 34), dtype=np.uint8)
-                cv2.putText(placeholder, 'Connecting...', (180, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (201, 209, 217), 2)
-                _, jpeg = cv2.imencode('.jpg', placeholder)
-                return jpeg.tobytes()
+        error_message = self.error_message
+        if error_message:
+            with self.lock:
+                jpeg = self._error_jpegs.get(error_message)
+                if jpeg is None:
+                    jpeg = self._encode_placeholder(f'Error: {error_message}', (50, 240), 0.7, (0, 0, 255))
+                    self._error_jpegs[error_message] = jpeg
+                return jpeg
+
+        # Encoding runs on the snapshot, so streaming clients never block the inference loop
+        frame = self._snapshot_frame()
+        if frame is not None:
+            return _encode_jpeg(frame)
+        else:
+            return self._placeholder_jpeg
 
     def _save_violation_to_db(self, violation_type, details, media_path):
         with self.SessionLocal() as db:
@@ -152,48 +473,36 @@ class KitchenComplianceProcessor(threading.Thread):
                 logging.error(f"Failed to save kitchen violation to DB: {e}")
                 db.rollback()
 
-    def _draw_bounding_boxes(self, frame, person_results, phone_results):
-        """Draw bounding boxes and labels on the frame"""
-        annotated_frame = frame.copy()
+    def _draw_bounding_boxes(self, frame, person_boxes, person_ids, phone_boxes, phone_confs):
+        """Draw bounding boxes and labels onto the frame in place"""
+        annotated_frame = frame
         
         # Draw person bounding boxes
-        if person_results and person_results[0].boxes.id is not None:
-            track_ids = person_results[0].boxes.id.int().cpu().tolist()
-            person_boxes = person_results[0].boxes.xyxy.cpu()
-            
-            for person_box, track_id in zip(person_boxes, track_ids):
-                x1, y1, x2, y2 = map(int, person_box)
-                # Draw person bounding box
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(annotated_frame, f'Person {track_id}', (x1, y1-10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        for (x1, y1, x2, y2), track_id in zip(person_boxes.tolist(), person_ids.tolist()):
+            # Draw person bounding box
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(annotated_frame, f'Person {track_id}', (x1, y1-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
         
         # Draw phone bounding boxes
-        for r in phone_results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                conf = float(box.conf[0])
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                cv2.putText(annotated_frame, f'Phone {conf:.2f}', (x1, y1-10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+        for (x1, y1, x2, y2), conf in zip(phone_boxes.astype(np.int32).tolist(), phone_confs.tolist()):
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            cv2.putText(annotated_frame, f'Phone {conf:.2f}', (x1, y1-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
         
-        # Draw apron/cap detection boxes
-        for r in self.last_apron_cap_results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                violation_class = self.apron_cap_model.names[int(box.cls[0])]
-                conf = float(box.conf[0])
+        # Draw apron/cap detection boxes (newest frame of the last batch only)
+        for xyxy, confs, classes in self.last_apron_cap_detections[-1:]:
+            for (x1, y1, x2, y2), conf, cls in zip(xyxy.astype(np.int32).tolist(), confs.tolist(), classes.tolist()):
+                violation_class = self.apron_cap_model.names[cls]
                 color = (0, 0, 255) if 'Without' in violation_class else (0, 255, 0)
                 cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
                 cv2.putText(annotated_frame, f'{violation_class} {conf:.2f}', (x1, y1-10), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
         
-        # Draw gloves detection boxes
-        for r in self.last_gloves_results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                glove_class = self.gloves_model.names[int(box.cls[0])]
-                conf = float(box.conf[0])
+        # Draw gloves detection boxes (newest frame of the last batch only)
+        for xyxy, confs, classes in self.last_gloves_detections[-1:]:
+            for (x1, y1, x2, y2), conf, cls in zip(xyxy.astype(np.int32).tolist(), confs.tolist(), classes.tolist()):
+                glove_class = self.gloves_model.names[cls]
                 cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
                 cv2.putText(annotated_frame, f'{glove_class} {conf:.2f}', (x1, y1-10), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
@@ -201,15 +510,206 @@ class KitchenComplianceProcessor(threading.Thread):
         return annotated_frame
 
     def _process_frame_optimized(self, frame):
-        """Optimized frame processing with CUDA support"""
-        if self.device == 'cuda':
-            # Convert to half precision for CUDA
-            frame_tensor = torch.from_numpy(frame).cuda().half()
-            frame_tensor = frame_tensor.permute(2, 0, 1).unsqueeze(0) / 255.0
-        else:
-            frame_tensor = frame
-        
-        return frame_tensor
+        """Letterbox the frame once to the network input size and upload it for all three models.
+
+        TensorRT engines get the square export size; PyTorch models get the
+        smallest stride-aligned rectangle, as Ultralytics' own letterbox does.
+        Returns the normalized (1, 3, H, W) RGB tensor and the scale that maps
+        network coordinates back to the frame.
+        """
+        height, width = frame.shape[:2]
+        scale = TRT_IMAGE_SIZE / max(height, width)
+        new_height, new_width = round(height * scale), round(width * scale)
+        resized = cv2.cvtColor(cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2RGB)
+
+        # Reusable staging buffer (page-locked on CUDA so the upload is an async DMA), padded
+        # bottom/right with letterbox gray so boxes only need to be divided by the scale
+        if self._input_buffer is None or self._input_shape != (new_height, new_width):
+            if self._square_input:
+                padded_height = padded_width = TRT_IMAGE_SIZE
+            else:
+                padded_height = -(-new_height // MODEL_STRIDE) * MODEL_STRIDE
+                padded_width = -(-new_width // MODEL_STRIDE) * MODEL_STRIDE
+            self._input_buffer = torch.full(
+                (1, 3, padded_height, padded_width), 114, dtype=torch.uint8, pin_memory=self.device == 'cuda'
+            )
+            self._input_shape = (new_height, new_width)
+            self._input_upload_done = torch.cuda.Event() if self.device == 'cuda' else None
+        elif self._input_upload_done is not None:
+            # The previous upload must have left the buffer before it is overwritten
+            self._input_upload_done.synchronize()
+        self._input_buffer[0, :, :new_height, :new_width].copy_(torch.from_numpy(resized).permute(2, 0, 1))
+        frame_tensor = self._input_buffer.to(self.device, non_blocking=True)
+        if self._input_upload_done is not None:
+            self._input_upload_done.record()
+
+        frame_tensor = frame_tensor.half() if self.device == 'cuda' else frame_tensor.float()
+        return frame_tensor / 255.0, scale
+
+    def _uniform_compliant_integral(self, frame):
+        """Summed-area table of the whole-frame yellow/black uniform color mask after CLAHE"""
+        # The same OpenCV calls accept UMat and dispatch to OpenCL kernels
+        source = cv2.UMat(frame) if USE_OPENCL else frame
+        hsv_frame = cv2.cvtColor(source, cv2.COLOR_BGR2HSV)
+        # CLAHE on V (= max(B, G, R)) instead of LAB's L avoids the BGR->LAB->BGR round trip
+        equalized_v = self.clahe.apply(cv2.extractChannel(hsv_frame, 2))
+
+        # Original H and S with the equalized V
+        hsv_frame = cv2.insertChannel(equalized_v, hsv_frame, 2)
+        mask_yellow = cv2.inRange(hsv_frame, YELLOW_LOWER, YELLOW_UPPER)
+        mask_black = cv2.inRange(equalized_v, int(BLACK_LOWER[2]), int(BLACK_UPPER[2]))
+        compliant_mask = cv2.bitwise_or(mask_yellow, mask_black)
+        if USE_OPENCL:
+            # Single download of the finished mask
+            compliant_mask = compliant_mask.get()
+        return cv2.integral(compliant_mask)
+
+    @staticmethod
+    def _region_ratio(integral, x1, y1, x2, y2):
+        """Fraction of set pixels of a 0/255 mask inside a box, via four summed-area table lookups"""
+        count = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        return count / (255 * (x2 - x1) * (y2 - y1))
+
+    def _uniform_compliant_ratios(self, frame, person_boxes):
+        """Share of uniform-colored torso pixels per person (None when the torso is empty)"""
+        height, width = frame.shape[:2]
+        compliant_integral = None
+        ratios = []
+        for x1, y1, x2, y2 in person_boxes.tolist():
+            ty1, ty2 = y1 + int((y2-y1)*0.1), y1 + int((y2-y1)*0.7)
+            x1, x2 = min(max(x1, 0), width), min(max(x2, 0), width)
+            ty1, ty2 = min(max(ty1, 0), height), min(max(ty2, 0), height)
+            if x2 <= x1 or ty2 <= ty1:
+                ratios.append(None)
+                continue
+
+            # Cheap prefilter: clear-cut torsos are decided from a tiny thumbnail
+            tiny = cv2.resize(frame[ty1:ty2, x1:x2], UNIFORM_PREFILTER_SIZE, interpolation=cv2.INTER_AREA)
+            hsv_tiny = cv2.cvtColor(tiny, cv2.COLOR_BGR2HSV)
+            tiny_mask = cv2.bitwise_or(cv2.inRange(hsv_tiny, YELLOW_LOWER, YELLOW_UPPER), cv2.inRange(hsv_tiny, BLACK_LOWER, BLACK_UPPER))
+            quick_ratio = cv2.countNonZero(tiny_mask) / tiny_mask.size
+            if quick_ratio < UNIFORM_PREFILTER_LOW or quick_ratio > UNIFORM_PREFILTER_HIGH:
+                ratios.append(quick_ratio)
+                continue
+
+            # Ambiguous: fall back to the CLAHE mask, computed at most once per frame
+            if compliant_integral is None:
+                compliant_integral = self._uniform_compliant_integral(frame)
+            ratios.append(self._region_ratio(compliant_integral, x1, ty1, x2, ty2))
+        return ratios
+
+    def _open_ffmpeg_capture(self, capture_options):
+        """Open the source with the given FFmpeg options, without racing other channels' opens.
+
+        The lock is held for the open itself (at most CAPTURE_TIMEOUT_MSEC for an
+        unreachable source), since OpenCV reads the options from inside it.
+        """
+        with _capture_options_lock:
+            os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = capture_options
+            return cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG, CAPTURE_PARAMS)
+
+    def _open_capture(self):
+        """Open the video source, preferring NVDEC hardware decoding on CUDA"""
+        tried_nvdec = self.device == 'cuda' and self._try_nvdec
+        if tried_nvdec:
+            cap = self._open_ffmpeg_capture(f'video_codec;{NVDEC_VIDEO_CODEC}|{FFMPEG_CAPTURE_OPTIONS}')
+            # Non-H.264 streams or FFmpeg builds without cuvid fail here or on the first read
+            if cap.isOpened() and cap.grab():
+                logging.info(f"Using NVDEC hardware decoding for Kitchen {self.channel_name}")
+                return cap
+            cap.release()
+            logging.info(f"NVDEC decoding unavailable for Kitchen {self.channel_name}, using software decoding")
+
+        cap = self._open_ffmpeg_capture(FFMPEG_CAPTURE_OPTIONS)
+        if tried_nvdec and cap.isOpened():
+            # The source is reachable, so NVDEC itself is what failed
+            self._try_nvdec = False
+        return cap
+
+    def _decode_frames(self, cap, is_file, video_fps):
+        """Decoder thread: read continuously and keep only the newest frame in the slot"""
+        frame_interval = 1.0 / video_fps
+        while self.is_running:
+            read_start = time.time()
+            success, frame = cap.read()
+            if not success:
+                if is_file:
+                    logging.info(f"Restarting video file for Kitchen {self.channel_name}...")
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                else:
+                    logging.warning(f"Reconnecting to Kitchen stream {self.channel_name}...")
+                    time.sleep(5)
+                    cap.release()
+                    cap = self._open_capture()
+                    continue
+
+            with self._slot_lock:
+                self._slot = frame
+            if is_file:
+                # Files decode faster than real time; pace them to their native frame rate
+                time.sleep(max(0.0, frame_interval - (time.time() - read_start)))
+        cap.release()
+
+    def _record_calibration_frame(self, frame, current_time):
+        """Save a raw frame now and then for INT8 calibration, until enough are collected"""
+        if current_time < self._next_calib_record_time:
+            return
+        self._next_calib_record_time = current_time + CALIB_RECORD_INTERVAL
+        if _calibration_image_count() >= CALIB_TARGET_FRAMES:
+            return
+        os.makedirs(CALIB_IMAGES_FOLDER, exist_ok=True)
+        timestamp = datetime.now(IST).strftime('%Y%m%d_%H%M%S')
+        cv2.imwrite(os.path.join(CALIB_IMAGES_FOLDER, f"{self.channel_id}_{timestamp}.jpg"), frame)
+
+    def _run_inference(self, frame, frame_count):
+        """Detect and track persons and phones in a frame, refreshing the apron/cap and gloves detections.
+
+        Returns the person boxes and track ids and the phone boxes and confidences,
+        all in frame coordinates.
+        """
+        # Resize and upload once; the same input tensor feeds every model
+        input_tensor, input_scale = self._process_frame_optimized(frame)
+
+        # Run inferences with optimized settings
+        with torch.inference_mode():
+            # Single fused pass for persons and phones on the shared server (batched with other
+            # channels), then tracked here; one device->host copy feeds the tracker
+            general_boxes = self.general_model.submit(input_tensor).result().boxes.cpu().numpy()
+            # Activated tracks as rows of x1, y1, x2, y2, track_id, conf, cls, detection index
+            tracks = np.asarray(self.tracker.update(general_boxes), dtype=np.float32).reshape(-1, 8)
+            track_xyxy = tracks[:, :4] / input_scale
+            is_person = tracks[:, 6] == PERSON_CLASS_ID
+            is_phone = tracks[:, 6] == PHONE_CLASS_ID
+            person_boxes = track_xyxy[is_person].astype(np.int32)
+            person_ids = tracks[is_person, 4].astype(np.int32)
+            phone_boxes = track_xyxy[is_phone]
+            phone_confs = tracks[is_phone, 5]
+
+            # Apron/cap and gloves need no temporal state, so sampled frames are
+            # micro-batched and handed to the shared servers in one go
+            if frame_count % FRAME_SKIP_RATE == 0:
+                self.frame_batch.append((input_tensor, input_scale))
+
+            if len(self.frame_batch) == MICRO_BATCH_SIZE:
+                batch_inputs = list(self.frame_batch)
+                self.frame_batch.clear()
+                # Both servers work concurrently; one detection set per batched frame,
+                # and the violation checks use all of them
+                apron_cap_futures = [self.apron_cap_model.submit(t) for t, _ in batch_inputs]
+                gloves_futures = [self.gloves_model.submit(t) for t, _ in batch_inputs]
+                self.last_apron_cap_detections = [
+                    _host_detections(f.result(), scale) for f, (_, scale) in zip(apron_cap_futures, batch_inputs)
+                ]
+                self.last_gloves_detections = [
+                    _host_detections(f.result(), scale) for f, (_, scale) in zip(gloves_futures, batch_inputs)
+                ]
+                # Surgical-glove boxes of the whole batch as one (N, 4) host array
+                self.last_gloves_boxes = np.concatenate(
+                    [xyxy[np.isin(classes, self._glove_class_ids)] for xyxy, _, classes in self.last_gloves_detections]
+                ).reshape(-1, 4)
+
+        return person_boxes, person_ids, phone_boxes, phone_confs
 
     def _trigger_alert(self, frame, violation_type, details):
         logging.warning(f"ALERT on {self.channel_name}: {details}")
@@ -228,10 +728,7 @@ class KitchenComplianceProcessor(threading.Thread):
         use_placeholder = os.environ.get('USE_PLACEHOLDER_FEED', 'false').lower() == 'true'
         
         if not use_placeholder:
-            os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = 'rtsp_transport;tcp|timeout;5000000'
-            cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-            cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 5000)
-            cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 5000)
+            cap = self._open_capture()
             
             if not cap.isOpened():
                 logging.warning(f"Could not open Kitchen stream for {self.channel_name}, using placeholder")
@@ -241,15 +738,16 @@ class KitchenComplianceProcessor(threading.Thread):
         
         if use_placeholder:
             logging.info(f"Using placeholder feed for Kitchen {self.channel_name}")
+            # Static background and text are rendered once; each tick copies it and adds the counter
+            template = np.full((480, 640, 3), (22, 27, 34), dtype=np.uint8)
+            cv2.putText(template, f'{self.channel_name}', (180, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (201, 209, 217), 2)
+            cv2.putText(template, f'Camera Offline - Test Mode', (120, 250), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (100, 150, 255), 2)
             frame_counter = 0
             while self.is_running:
-                frame = np.full((480, 640, 3), (22, 27, 34), dtype=np.uint8)
-                cv2.putText(frame, f'{self.channel_name}', (180, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (201, 209, 217), 2)
-                cv2.putText(frame, f'Camera Offline - Test Mode', (120, 250), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (100, 150, 255), 2)
+                frame = template.copy()
                 cv2.putText(frame, f'Frame: {frame_counter}', (230, 290), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 150, 150), 1)
                 
-                with self.lock:
-                    self.latest_frame = frame
+                self._publish_frame(frame)
                 frame_counter += 1
                 time.sleep(0.1)
             return
@@ -257,133 +755,114 @@ class KitchenComplianceProcessor(threading.Thread):
         is_file = any(self.rtsp_url.lower().endswith(ext) for ext in ['.mp4', '.avi', '.mov'])
         frame_count = 0
         video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
-        phone_persistence_frames = int(PHONE_PERSISTENCE_SECONDS * video_fps)
 
+        # Decoding runs on its own thread so FFmpeg never buffers frames behind slow inference
+        decoder = threading.Thread(
+            target=self._decode_frames, args=(cap, is_file, video_fps),
+            name=f"KitchenDecoder-{self.channel_name}", daemon=True
+        )
+        decoder.start()
 
-        while self.is_running:
-            success, frame = cap.read()
-            if not success:
-                if is_file:
-                    logging.info(f"Restarting video file for Kitchen {self.channel_name}...")
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-                else:
-                    logging.warning(f"Reconnecting to Kitchen stream {self.channel_name}...")
-                    time.sleep(5)
-                    cap.release()
-                    cap = cv2.VideoCapture(self.rtsp_url)
+        try:
+            while self.is_running:
+                # Take the freshest frame; anything older was already overwritten
+                with self._slot_lock:
+                    frame, self._slot = self._slot, None
+                if frame is None:
+                    time.sleep(0.001)
                     continue
 
-            frame_count += 1
-            current_time = time.time()
+                frame_count += 1
+                current_time = time.time()
+                if TRT_INT8:
+                    self._record_calibration_frame(frame, current_time)
             
-            # Optimized frame processing
-            processed_frame = self._process_frame_optimized(frame)
-            
-            # Run inferences with optimized settings
-            with torch.no_grad() if self.device == 'cuda' else torch.enable_grad():
-                person_results = self.general_model.track(
-                    frame, persist=True, classes=[0], 
-                    conf=CONFIDENCE_THRESHOLD, verbose=False,
-                    device=self.device
-                )
-                phone_results = self.general_model(
-                    frame, classes=[67], conf=CONFIDENCE_THRESHOLD, 
-                    verbose=False, device=self.device
-                )
-
-                if frame_count % FRAME_SKIP_RATE == 0:
-                    self.last_apron_cap_results = self.apron_cap_model(
-                        frame, conf=CONFIDENCE_THRESHOLD, 
-                        verbose=False, device=self.device
-                    )
-                    self.last_gloves_results = self.gloves_model(
-                        frame, conf=CONFIDENCE_THRESHOLD, 
-                        verbose=False, device=self.device
-                    )
-
-            # Draw bounding boxes and create annotated frame
-            annotated_frame = self._draw_bounding_boxes(frame, person_results, phone_results)
-            
-            # Update the latest frame with annotations
-            with self.lock:
-                self.latest_frame = annotated_frame.copy()
+                # A failed shared batch (e.g. CUDA OOM) fails every channel in it; each channel
+                # drops that frame and carries on instead of its thread exiting
+                try:
+                    person_boxes, person_ids, phone_boxes, phone_confs = self._run_inference(frame, frame_count)
+                except Exception as e:
+                    logging.error(f"Kitchen inference failed for {self.channel_name}, skipping frame: {e}")
+                    time.sleep(INFERENCE_RETRY_DELAY)
+                    continue
 
-            # --- Process Each Person ---
-            if person_results and person_results[0].boxes.id is not None:
-                track_ids = person_results[0].boxes.id.int().cpu().tolist()
-                person_boxes = person_results[0].boxes.xyxy.cpu()
+                # Uniform colors are measured before boxes are drawn onto the frame
+                uniform_ratios = self._uniform_compliant_ratios(frame, person_boxes)
 
-                detected_gloves_boxes = [box.xyxy[0] for r in self.last_gloves_results for box in r.boxes if self.gloves_model.names[int(box.cls[0])] == 'surgical-gloves']
+                # Draw bounding boxes directly onto the freshly read frame
+                annotated_frame = self._draw_bounding_boxes(frame, person_boxes, person_ids, phone_boxes, phone_confs)
+            
+                self._publish_frame(annotated_frame)
 
-                for person_box, track_id in zip(person_boxes, track_ids):
-                    px1, py1, px2, py2 = map(int, person_box)
-                    
+                # --- Process Each Person ---
+                gloves_boxes = self.last_gloves_boxes
+                for (px1, py1, px2, py2), track_id, compliant_ratio in zip(person_boxes.tolist(), person_ids.tolist(), uniform_ratios):
                     # 1. Check for Apron/Cap Violations
-                    for r in self.last_apron_cap_results:
-                        for box in r.boxes:
-                            violation_class = self.apron_cap_model.names[int(box.cls[0])]
-                            if violation_class in ['Without-apron', 'Without-cap']:
-                                if current_time - self.person_violation_tracker[track_id][violation_class] > ALERT_COOLDOWN_SECONDS:
-                                    self.person_violation_tracker[track_id][violation_class] = current_time
+                    for _, _, classes in self.last_apron_cap_detections:
+                        for cls in classes.tolist():
+                            if cls == self._without_apron_id or cls == self._without_cap_id:
+                                violation_class = self.apron_cap_model.names[cls]
+                                if current_time - self.person_violation_tracker.get((track_id, violation_class), 0.0) > ALERT_COOLDOWN_SECONDS:
+                                    self.person_violation_tracker[(track_id, violation_class)] = current_time
                                     details = f"Person ID {track_id} detected with '{violation_class}'."
                                     self._trigger_alert(annotated_frame, violation_class, details)
 
                     # 2. Check for Gloves Violation
-                    has_gloves = any(g_box[0] > px1 and g_box[2] < px2 and g_box[1] > py1 and g_box[3] < py2 for g_box in detected_gloves_boxes)
+                    has_gloves = bool((
+                        (gloves_boxes[:, 0] > px1) & (gloves_boxes[:, 2] < px2) &
+                        (gloves_boxes[:, 1] > py1) & (gloves_boxes[:, 3] < py2)
+                    ).any())
                     if not has_gloves:
-                        if current_time - self.person_violation_tracker[track_id]['No-Gloves'] > ALERT_COOLDOWN_SECONDS:
-                            self.person_violation_tracker[track_id]['No-Gloves'] = current_time
+                        if current_time - self.person_violation_tracker.get((track_id, 'No-Gloves'), 0.0) > ALERT_COOLDOWN_SECONDS:
+                            self.person_violation_tracker[(track_id, 'No-Gloves')] = current_time
                             details = f"Person ID {track_id} has no gloves."
                             self._trigger_alert(annotated_frame, "No-Gloves", details)
-                    
+                
                     # 3. Check for Uniform Color Violation
-                    torso_crop = frame[py1 + int((py2-py1)*0.1):py1 + int((py2-py1)*0.7), px1:px2]
-                    if torso_crop.size > 0:
-                        lab_torso = cv2.cvtColor(torso_crop, cv2.COLOR_BGR2LAB)
-                        l, a, b = cv2.split(lab_torso)
-                        equalized_l = self.clahe.apply(l)
-                        merged_lab = cv2.merge((equalized_l, a, b))
-                        equalized_torso = cv2.cvtColor(merged_lab, cv2.COLOR_LAB2BGR)
-                        hsv_torso = cv2.cvtColor(equalized_torso, cv2.COLOR_BGR2HSV)
-                        
-                        mask_yellow = cv2.inRange(hsv_torso, YELLOW_LOWER, YELLOW_UPPER)
-                        mask_black = cv2.inRange(hsv_torso, BLACK_LOWER, BLACK_UPPER)
-                        compliant_mask = cv2.bitwise_or(mask_yellow, mask_black)
-                        
-                        total_pixels = torso_crop.shape[0] * torso_crop.shape[1]
-                        compliant_ratio = np.count_nonzero(compliant_mask) / total_pixels if total_pixels > 0 else 0
-
-                        if compliant_ratio < 0.30: # If less than 30% of torso is compliant color
-                            if current_time - self.person_violation_tracker[track_id]['Uniform-Violation'] > ALERT_COOLDOWN_SECONDS:
-                                self.person_violation_tracker[track_id]['Uniform-Violation'] = current_time
+                    if compliant_ratio is not None:
+                        if compliant_ratio < UNIFORM_COMPLIANT_MIN_RATIO: # If less than 30% of torso is compliant color
+                            if current_time - self.person_violation_tracker.get((track_id, 'Uniform-Violation'), 0.0) > ALERT_COOLDOWN_SECONDS:
+                                self.person_violation_tracker[(track_id, 'Uniform-Violation')] = current_time
                                 details = f"Person ID {track_id} has a uniform color violation."
                                 self._trigger_alert(annotated_frame, "Uniform-Violation", details)
 
-            # --- 4. Detect and Track Mobile Phones ---
-            current_phones = [box.xyxy[0] for r in phone_results for box in r.boxes]
-            new_phone_tracker = {}
-
-            for phone_box in current_phones:
-                cx, cy = int((phone_box[0] + phone_box[2]) / 2), int((phone_box[1] + phone_box[3]) / 2)
-                found_match = False
-                for phone_id, data in self.phone_tracker.items():
-                    dist = np.sqrt((cx - data['center'][0])**2 + (cy - data['center'][1])**2)
-                    if dist < 50:
-                        new_phone_tracker[phone_id] = {'box': phone_box, 'frames': data['frames'] + 1, 'center': (cx, cy), 'alerted': data.get('alerted', False)}
-                        found_match = True
-                        break
-                if not found_match:
-                    new_id = max(self.phone_tracker.keys(), default=0) + 1
-                    new_phone_tracker[new_id] = {'box': phone_box, 'frames': 1, 'center': (cx, cy), 'alerted': False}
-
-            self.phone_tracker = new_phone_tracker
-
-            for phone_id, data in self.phone_tracker.items():
-                if data['frames'] > phone_persistence_frames and not data['alerted']:
-                    data['alerted'] = True # Mark as alerted to prevent spamming
+                # --- 4. Detect and Track Mobile Phones ---
+                centers = ((phone_boxes[:, :2] + phone_boxes[:, 2:4]) / 2).astype(np.float32)
+                num_phones = len(centers)
+                if num_phones and len(self.phone_ids):
+                    # Squared distances from every detection to every tracked phone
+                    dist_sq = ((centers[:, None, :] - self.phone_centers[None, :, :]) ** 2).sum(axis=-1)
+                    nearest = dist_sq.argmin(axis=1)
+                    matched = dist_sq[np.arange(num_phones), nearest] < PHONE_MATCH_DISTANCE ** 2
+                else:
+                    nearest = np.zeros(num_phones, dtype=np.intp)
+                    matched = np.zeros(num_phones, dtype=bool)
+
+                ids = np.empty(num_phones, dtype=np.int64)
+                ids[matched] = self.phone_ids[nearest[matched]]
+                num_new = num_phones - np.count_nonzero(matched)
+                ids[~matched] = np.arange(self.next_phone_id, self.next_phone_id + num_new)
+                self.next_phone_id += num_new
+                first_seen = np.full(num_phones, current_time, dtype=np.float64)
+                first_seen[matched] = self.phone_first_seen[nearest[matched]]
+                alerted = np.zeros(num_phones, dtype=bool)
+                alerted[matched] = self.phone_alerted[nearest[matched]]
+
+                # Two detections matching the same track keep a single entry
+                _, unique_rows = np.unique(ids, return_index=True)
+                self.phone_ids = ids[unique_rows]
+                self.phone_centers = centers[unique_rows]
+                self.phone_first_seen = first_seen[unique_rows]
+                self.phone_alerted = alerted[unique_rows]
+
+                # Time-based, since the decoder may drop frames while inference is busy
+                due = (current_time - self.phone_first_seen > PHONE_PERSISTENCE_SECONDS) & ~self.phone_alerted
+                self.phone_alerted |= due # Mark as alerted to prevent spamming
+                for _ in range(np.count_nonzero(due)):
                     details = f"Mobile phone detected in restricted area for {PHONE_PERSISTENCE_SECONDS} seconds."
                     self._trigger_alert(annotated_frame, "Mobile-Phone", details)
-        
-        cap.release()
+        finally:
+            # Also stop the decoder when the loop raised, so it releases the capture
+            self.is_running = False
+            decoder.join()
 